@@ -1,6 +1,10 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 from datetime import datetime
 import glob
 import os
@@ -15,36 +19,89 @@ st.title("⚡ ENTSO-E Transparency Generation Unit Explorer")
 
 
 # Load data
-@st.cache_data
-def load_csv_data(folder, delimiter=",", dtypes=None, parse_dates=None, usecols=None):
-    csv_files = glob.glob(os.path.join(folder, "*.csv"))
-    if not csv_files:
-        raise FileNotFoundError(f"No CSV files found in {folder}")
-    dfs = []
-    for f in csv_files:
-        df = pd.read_csv(
-            f,
-            encoding="utf-8",
-            delimiter=delimiter,
-            dtype=dtypes,
-            parse_dates=parse_dates,
-            usecols=usecols,
-            low_memory=False,
-        )
-        dfs.append(df)
-    return pd.concat(dfs, ignore_index=True)
-
-
-@st.cache_data
-def load_parquet_data(folder):
+# cache_resource skips hashing the returned frame on every rerun; the frame
+# is shared between sessions, so callers must not modify it in place
+@st.cache_resource
+def load_parquet_data(folder, columns=None, dtypes=None):
     parquet_files = glob.glob(os.path.join(folder, "*.parquet"))
     if not parquet_files:
         raise FileNotFoundError(f"No Parquet files found in {folder}")
     dfs = []
     for f in parquet_files:
-        df = pd.read_parquet(f)
+        df = pd.read_parquet(f, columns=columns, dtype_backend="pyarrow")
         dfs.append(df)
-    return pd.concat(dfs, ignore_index=True)
+    df = pd.concat(dfs, ignore_index=True)
+    # Cast after concat so categoricals share one set of categories
+    if dtypes:
+        df = df.astype(dtypes)
+    return df
+
+
+@st.cache_resource
+def load_parquet_dataset(folder):
+    if not glob.glob(os.path.join(folder, "**", "*.parquet"), recursive=True):
+        raise FileNotFoundError(f"No Parquet files found in {folder}")
+    return ds.dataset(folder, format="parquet", partitioning="hive")
+
+
+# Every distinct selection and date range is a new entry, so bound the cache
+@st.cache_data(max_entries=32, ttl="1h")
+def load_generation(folder, units, start, end):
+    # Filters are pushed down to the Parquet scan: the Year partitions outside
+    # the range are never opened, and row groups are skipped by their stats
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    dataset = load_parquet_dataset(folder)
+    table = dataset.to_table(
+        columns=["DateTime", "GenerationUnitCode", "Generation_MWh"],
+        filter=(ds.field("Year") >= start.year)
+        & (ds.field("Year") <= end.year)
+        & (ds.field("DateTime") >= pa.scalar(start))
+        & (ds.field("DateTime") <= pa.scalar(end))
+        & ds.field("GenerationUnitCode").isin(units),
+    )
+    return gen_unique(table.to_pandas())
+
+
+@st.cache_data
+def last_generation_date(folder):
+    dataset = load_parquet_dataset(folder)
+    return pc.max(dataset.to_table(columns=["DateTime"])["DateTime"]).as_py().date()
+
+
+@st.cache_data
+def latest_per_unit(df):
+    # Keep only the most recent record of each generation unit, indexed by
+    # its code so selected units can be looked up directly
+    return (
+        df.sort_values("UpdateTime(UTC)")
+        .drop_duplicates("GenerationUnitCode", keep="last")
+        .set_index("GenerationUnitCode", drop=False)
+        .rename_axis(None)
+    )
+
+
+def gen_unique(df):
+    # One generation value per unit and day
+    return (
+        df.groupby(["DateTime", "GenerationUnitCode"], observed=True)["Generation_MWh"]
+        .mean()
+        .reset_index()
+    )
+
+
+@st.cache_data
+def unit_labels(df):
+    # Legend label of each unit: "GenerationUnitName (GenerationUnitCode)"
+    df = df.drop_duplicates(subset="GenerationUnitCode", keep="first")
+    return {
+        code: f"{name} ({code})"
+        for code, name in zip(df["GenerationUnitCode"], df["GenerationUnitName"])
+    }
+
+
+def to_csv_bytes(df):
+    # Only called when a download button is clicked
+    return df.to_csv(index=False).encode("utf-8")
 
 
 # Load units list
@@ -59,13 +116,31 @@ cols_to_load = [
     "ProductionUnitName",
     "UpdateTime(UTC)",
 ]
-df_units = load_csv_data("data/unit list/", usecols=cols_to_load)
+category_cols = [
+    "AreaDisplayName",
+    "GenerationUnitType",
+    "GenerationUnitStatus",
+    "GenerationUnitCode",
+]
+df_units = load_parquet_data(
+    "data/unit list/",
+    columns=cols_to_load,
+    dtypes={col: "category" for col in category_cols},
+)
 df_units = df_units[
     df_units["GenerationUnitCode"].notna() & df_units["AreaDisplayName"].notna()
 ].reset_index()
+for col in category_cols:
+    df_units[col] = df_units[col].cat.remove_unused_categories()
 
-# Load generation data
-df_generation = load_parquet_data("data/generation/")
+# Multiselect options, already sorted as categories
+filter_options = {
+    col: df_units[col].cat.categories.tolist()
+    for col in ["AreaDisplayName", "GenerationUnitType", "GenerationUnitStatus"]
+}
+
+# Generation data is scanned on demand from this folder
+generation_folder = "data/generation/"
 
 
 # Add a helper to reset filter widgets using session_state
@@ -78,35 +153,43 @@ def reset_filters():
 
 
 # Callback to sync selection changes
-def sync_selection():
+def sync_selection(filtered_df_units):
     if "unit_editor" in st.session_state:
         edited_df = st.session_state["unit_editor"]["edited_rows"]
 
         # Get the current filtered dataframe to know which rows correspond to which units
-        for idx, changes in edited_df.items():
-            if "Selected" in changes:
-                # Get the GenerationUnitCode for this row
-                unit_code = filtered_df_units.iloc[idx]["GenerationUnitCode"]
-
-                if changes["Selected"]:
-                    # Add to selected units if not already there
-                    if unit_code not in st.session_state["selected_units"]:
-                        st.session_state["selected_units"].append(unit_code)
-                else:
-                    # Remove from selected units
-                    if unit_code in st.session_state["selected_units"]:
-                        st.session_state["selected_units"].remove(unit_code)
+        code_col = filtered_df_units.columns.get_loc("GenerationUnitCode")
+        to_add = {
+            filtered_df_units.iat[idx, code_col]
+            for idx, changes in edited_df.items()
+            if changes.get("Selected") is True
+        }
+        to_remove = {
+            filtered_df_units.iat[idx, code_col]
+            for idx, changes in edited_df.items()
+            if changes.get("Selected") is False
+        }
+        st.session_state["selected_units"] |= to_add
+        st.session_state["selected_units"] -= to_remove
+        st.session_state["selection_changed"] = True
+
+
+def unselect_all():
+    st.session_state["selected_units"].clear()
+    st.session_state["selection_changed"] = True
 
 
 if "selected_units" not in st.session_state:
-    st.session_state["selected_units"] = []
+    # Stored as a set; sort it where an ordered list is needed
+    st.session_state["selected_units"] = set()
 
-# Main content - Tabs
-tab1, tab2, tab3 = st.tabs(
-    ["🔍 Select your generation unit(s)", "📊 Explore generation", "ℹ️ Read me"]
-)
 
-with tab1:
+@st.fragment
+def select_units_tab():
+    # Selection changes also affect the other tabs, so rerun the whole app
+    if st.session_state.pop("selection_changed", False):
+        st.rerun()
+
     st.header("Select your generation unit(s)")
     st.markdown(
         "Explore, filter and select your generation units by ticking the checkboxes. When you're ready, go to the 'Explore generation' tab to visualize the data."
@@ -122,29 +205,26 @@ with tab1:
 
         with col2:
             # AreaDisplayName filter
-            areas = []
-            if df_units is not None:
-                areas = sorted(df_units["AreaDisplayName"].dropna().unique())
             selected_areas = st.multiselect(
-                "AreaDisplayName", options=list(areas), key="selected_areas"
+                "AreaDisplayName",
+                options=filter_options["AreaDisplayName"],
+                key="selected_areas",
             )
 
         with col3:
             # GenerationUnitType filter
-            unit_types = []
-            if df_units is not None:
-                unit_types = sorted(df_units["GenerationUnitType"].dropna().unique())
             selected_types = st.multiselect(
-                "GenerationUnitType", options=list(unit_types), key="selected_types"
+                "GenerationUnitType",
+                options=filter_options["GenerationUnitType"],
+                key="selected_types",
             )
 
         with col4:
             # GenerationUnitStatus filter
-            unit_status = []
-            if df_units is not None:
-                unit_status = sorted(df_units["GenerationUnitStatus"].dropna().unique())
             selected_status = st.multiselect(
-                "GenerationUnitStatus", options=list(unit_status), key="selected_status"
+                "GenerationUnitStatus",
+                options=filter_options["GenerationUnitStatus"],
+                key="selected_status",
             )
 
         col1, col2, col3 = st.columns(3)
@@ -164,17 +244,13 @@ with tab1:
             # Unselect all button
             st.button(
                 "Unselect all",
-                on_click=lambda: st.session_state["selected_units"].clear(),
+                on_click=unselect_all,
             )
 
     # Apply filters
-    filtered_df_units = df_units.copy()
-
-    filtered_df_units = (
-        filtered_df_units.sort_values("UpdateTime(UTC)")
-        .groupby("GenerationUnitCode")
-        .tail(1)
-    ).reset_index(drop=True)
+    # Fetched inside the fragment: fragment reruns reuse the module globals
+    # of the last full run, while st.cache_data hands back a fresh copy here
+    filtered_df_units = latest_per_unit(df_units)
 
     # Filter by selected unit
     if show_selected_only:
@@ -204,24 +280,38 @@ with tab1:
 
     # Apply text search
     if search_term:
-        mask = (
-            filtered_df_units.astype(str)
-            .apply(lambda x: x.str.contains(search_term, case=False, na=False))
-            .any(axis=1)
-        )
+        # Only search text columns, without casting the whole frame to str
+        searchable_cols = [
+            c
+            for c in filtered_df_units.columns
+            if filtered_df_units[c].dtype == object
+            or isinstance(filtered_df_units[c].dtype, pd.CategoricalDtype)
+            or pd.api.types.is_string_dtype(filtered_df_units[c])
+        ]
+        mask = np.zeros(len(filtered_df_units), dtype=bool)
+        for c in searchable_cols:
+            mask |= (
+                filtered_df_units[c]
+                .astype("string")
+                .str.contains(search_term, case=False, na=False, regex=False)
+                .to_numpy()
+            )
         filtered_df_units = filtered_df_units[mask]
 
-    # Add Selected column based on current session state
-    filtered_df_units.insert(
-        0,
-        "Selected",
-        filtered_df_units["GenerationUnitCode"].isin(
-            st.session_state["selected_units"]
-        ),
-    )
-
-    # Display dataframe
-    filtered_df_units = filtered_df_units.drop_duplicates().reset_index(drop=True)
+    # Add Selected column based on current session state. The lookup goes
+    # through the GenerationUnitCode index; its hash table is rebuilt for
+    # each render, so this is still O(rows), but it is skipped entirely when
+    # nothing is selected
+    selected = np.zeros(len(filtered_df_units), dtype=bool)
+    if st.session_state["selected_units"]:
+        positions = filtered_df_units.index.get_indexer(
+            list(st.session_state["selected_units"])
+        )
+        selected[positions[positions >= 0]] = True
+    # With no filter active this is still the latest_per_unit frame, so
+    # insert into a shallow copy rather than modifying that frame in place
+    filtered_df_units = filtered_df_units.copy(deep=False)
+    filtered_df_units.insert(0, "Selected", selected)
 
     # Display current selection count
     if len(st.session_state["selected_units"]) == 0:
@@ -240,20 +330,22 @@ with tab1:
         hide_index=True,
         key="unit_editor",
         on_change=sync_selection,
+        args=(filtered_df_units,),
         disabled=[col for col in filtered_df_units.columns if col != "Selected"],
     )
 
     # Download button
-    csv = filtered_df_units.to_csv(index=False).encode("utf-8")
     st.download_button(
         label="📥 Download filtered data as CSV",
-        data=csv,
+        data=lambda: to_csv_bytes(filtered_df_units),
         file_name="filtered_generation_units.csv",
         mime="text/csv",
     )
 
-with tab2:
-    selected_units = st.session_state["selected_units"]
+
+@st.fragment
+def explore_generation_tab():
+    selected_units = sorted(st.session_state["selected_units"])
     st.header("Explore generation")
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -264,33 +356,14 @@ with tab2:
             value=(datetime.now().year - 1, datetime.now().year),
         )
 
-    generation_units_name = (
-        df_units.drop_duplicates(subset="GenerationUnitCode", keep="first")[
-            ["GenerationUnitCode", "GenerationUnitName"]
-        ]
-        .set_index("GenerationUnitCode")["GenerationUnitName"]
-        .to_dict()
-    )
-
-    filtered_generation = (
-        df_generation[["DateTime", "GenerationUnitCode", "Generation_MWh"]]
-        .drop_duplicates()
-        .copy()
-    )
+    generation_unit_labels = unit_labels(df_units)
 
     if len(selected_units) > 0:
-        filtered_generation = filtered_generation[
-            filtered_generation["GenerationUnitCode"].isin(selected_units)
-        ]
-        filtered_generation = filtered_generation[
-            filtered_generation["DateTime"].between(
-                f"{filtered_years[0]}-01-01", f"{filtered_years[1]}-12-31"
-            )
-        ]
-        filtered_generation = (
-            filtered_generation.groupby(["DateTime", "GenerationUnitCode"])
-            .mean()
-            .reset_index()
+        filtered_generation = load_generation(
+            generation_folder,
+            selected_units,
+            f"{filtered_years[0]}-01-01",
+            f"{filtered_years[1]}-12-31",
         )
     else:
         st.info("Select at least one generation unit to see the data.")
@@ -298,10 +371,9 @@ with tab2:
     if len(selected_units) > 0 and not filtered_generation.empty:
         # Create a new column with the formatted legend label
         filtered_generation["Unit_Label"] = (
-            filtered_generation["GenerationUnitCode"].map(generation_units_name)
-            + " ("
-            + filtered_generation["GenerationUnitCode"]
-            + ")"
+            filtered_generation["GenerationUnitCode"]
+            .astype(str)
+            .map(generation_unit_labels)
         )
 
         # Plot
@@ -322,10 +394,9 @@ with tab2:
         st.plotly_chart(fig)
 
         # Download button
-        csv = filtered_generation.to_csv(index=False).encode("utf-8")
         st.download_button(
             label="📥 Download generation data as CSV",
-            data=csv,
+            data=lambda: to_csv_bytes(filtered_generation),
             file_name="generation_data.csv",
             mime="text/csv",
         )
@@ -333,6 +404,18 @@ with tab2:
     elif len(selected_units) > 0 and filtered_generation.empty:
         st.warning("No generation data available for the selected units and years.")
 
+
+# Main content - Tabs
+tab1, tab2, tab3 = st.tabs(
+    ["🔍 Select your generation unit(s)", "📊 Explore generation", "ℹ️ Read me"]
+)
+
+with tab1:
+    select_units_tab()
+
+with tab2:
+    explore_generation_tab()
+
 with tab3:
     st.header("About this App")
     st.markdown(
@@ -347,7 +430,5 @@ Developed by **e-zaline** for **Beyond Fossil Fuels**.
 """
     )
 
-    last_update = (
-        df_generation["DateTime"].max() if df_generation is not None else "N/A"
-    )
+    last_update = last_generation_date(generation_folder)
     st.markdown(f"**Data last updated:** {last_update}")
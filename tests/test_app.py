@@ -0,0 +1,19 @@
+import runpy
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_select_units_tab_fragment_rerun(monkeypatch):
+    monkeypatch.chdir(REPO_ROOT)
+    app = runpy.run_path(str(REPO_ROOT / "app.py"))
+
+    # A fragment rerun calls the tab function again against the module
+    # globals of the last full run; AppTest only does full reruns, so call
+    # the undecorated function directly
+    select_units_tab = app["select_units_tab"].__wrapped__
+    select_units_tab()
+    select_units_tab()
+
+    latest_units = app["latest_per_unit"](app["df_units"])
+    assert "Selected" not in latest_units.columns
@@ -1,7 +1,13 @@
 from entsoe.files import EntsoeFileClient
-import pandas as pd
+import polars as pl
+import pyarrow as pa
+import pyarrow.parquet as pq
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from requests.adapters import HTTPAdapter
 import os
+import requests
+import threading
 
 # Get credentials from environment variables
 username = os.environ.get("API_USERNAME")
@@ -10,8 +16,29 @@ password = os.environ.get("API_PASSWORD")
 if not username or not password:
     raise ValueError("API_USERNAME and API_PASSWORD must be set")
 
+# Seconds to wait on a stalled connection before failing the job
+REQUEST_TIMEOUT = 300
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    # download_single_file_raw does not pass the client's timeout to requests,
+    # so apply it to every request sent through the session instead
+    def send(self, request, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = REQUEST_TIMEOUT
+        return super().send(request, **kwargs)
+
+
+def make_client():
+    session = requests.Session()
+    session.mount("https://", TimeoutHTTPAdapter())
+    return EntsoeFileClient(
+        username=username, pwd=password, session=session, timeout=REQUEST_TIMEOUT
+    )
+
+
 # ENTSO-E TP
-client = EntsoeFileClient(username=username, pwd=password)
+client = make_client()
 # this returns a dict of {filename: unique_id}:
 
 # Production and Generation Units
@@ -22,41 +49,76 @@ df_units = client.download_single_file(
 )
 # Create the directory if it doesn't exist
 os.makedirs("data/unit list", exist_ok=True)
-df_units.to_csv("data/unit list/ProductionAndGenerationUnits_r2.csv", index=False)
+pq.write_table(
+    pa.Table.from_pandas(df_units, preserve_index=False),
+    "data/unit list/ProductionAndGenerationUnits_r2.parquet",
+    compression="zstd",
+)
 
 # Generation Data
-file_list = client.list_folder("ActualGenerationOutputPerGenerationUnit_16.1.A_r2.1")
-for year in range(datetime.now().year, datetime.now().year + 1):
-    filtered_file_list = {k: v for k, v in file_list.items() if k.startswith(str(year))}
-    ids_list = list(filtered_file_list.values())
-    df_generation = client.download_multiple_files(ids_list)
+generation_folder = "ActualGenerationOutputPerGenerationUnit_16.1.A_r2.1"
+thread_local = threading.local()
 
-    # Daily generation
-    df_generation["Hour"] = df_generation["ResolutionCode"].apply(
-        lambda x: 0.25 if x == "PT15M" else (0.5 if x == "PT30M" else 1)
-    )
-    df_generation["Generation_MWh"] = (
-        (df_generation["ActualGenerationOutput(MW)"] * df_generation["Hour"])
-        .fillna(0)
-        .astype("int32")
+
+def download_generation_file(filename):
+    # Each worker thread logs in with its own client, so the requests session
+    # and the token refresh are never shared between threads
+    if not hasattr(thread_local, "client"):
+        thread_local.client = make_client()
+    return thread_local.client.download_single_file(
+        folder=generation_folder, filename=filename
     )
-    df_generation["DateTime"] = pd.to_datetime(df_generation["DateTime (UTC)"])
-    df_generation["DateTime"] = df_generation["DateTime"].dt.strftime("%Y-%m-%d")
 
+
+file_list = client.list_folder(generation_folder)
+for year in range(datetime.now().year, datetime.now().year + 1):
+    filenames = [k for k in file_list if k.startswith(str(year))]
+
+    # Download the files of the year in parallel
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        frames = list(executor.map(download_generation_file, filenames))
+
+    # Daily generation, partitioned by year and month so readers can skip
+    # whole directories
+    hour_map = {"PT15M": 0.25, "PT30M": 0.5, "PT60M": 1.0, "PT1H": 1.0}
+    generation = pl.concat([pl.from_pandas(f) for f in frames], how="vertical_relaxed")
+    # Release the downloaded pandas frames before the query runs
+    del frames
     result = (
-        df_generation.groupby(
-            [
-                "DateTime",
-                "GenerationUnitCode",
-            ],
-            observed=False,
-        )["Generation_MWh"]
-        .sum()
-        .reset_index()
+        generation.lazy()
+        .with_columns(
+            (
+                pl.col("ActualGenerationOutput(MW)").cast(pl.Float32)
+                * pl.col("ResolutionCode").replace_strict(
+                    hour_map, default=1.0, return_dtype=pl.Float32
+                )
+            )
+            .fill_null(0.0)
+            .alias("Generation_MWh"),
+            pl.col("DateTime (UTC)")
+            .str.to_datetime(time_unit="us")
+            .dt.truncate("1d")
+            .alias("DateTime"),
+        )
+        .group_by(["DateTime", "GenerationUnitCode"])
+        .agg(pl.col("Generation_MWh").sum())
+        .sort(["DateTime", "GenerationUnitCode"])
+        .with_columns(
+            pl.col("GenerationUnitCode").cast(pl.Categorical),
+            pl.col("Generation_MWh").cast(pl.Float32),
+            pl.col("DateTime").dt.year().alias("Year"),
+            pl.col("DateTime").dt.month().alias("Month"),
+        )
+        .collect(engine="streaming")
     )
 
     # Create the directory if it doesn't exist
     os.makedirs("data/generation", exist_ok=True)
-    result.to_parquet(
-        f"data/generation/all_units_daily_generation_{str(year)}.parquet", index=False
+    pq.write_to_dataset(
+        result.to_arrow(),
+        root_path="data/generation",
+        partition_cols=["Year", "Month"],
+        basename_template="part-{i}.parquet",
+        existing_data_behavior="delete_matching",
+        compression="zstd",
     )